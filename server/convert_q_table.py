@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Convert a pickled Q-table into the arrays loaded by reversi_server.py.
+
+The pickle maps "W" + 64 cell strings ("B", "W" or " " per cell, row-major)
+or (black, white) bitboard pairs to 64 values, given either as a sequence or
+as an {index: value} dict. The output is a float32 (n, 64) value array and a
+uint64 (n, 2) array of the matching bitboard keys.
+"""
+import pickle
+import sys
+
+import numpy as np
+
+from reversi_server import AI_Q_KEYS_PATH, AI_Q_VALUES_PATH
+
+
+def state_key_from_string(key):
+    black = white = 0
+    for i, column in enumerate(key[1:]):
+        if column == "B":
+            black |= 1 << i
+        elif column == "W":
+            white |= 1 << i
+    return black, white
+
+
+def q_row(values):
+    if isinstance(values, dict):
+        row = np.zeros(64, dtype=np.float32)
+        for idx, v in values.items():
+            row[idx] = v
+        return row
+    return np.asarray(values, dtype=np.float32)
+
+
+def main(path="reversi_q_table.pkl"):
+    with open(path, "rb") as f:
+        table = pickle.load(f)
+
+    keys = np.empty((len(table), 2), dtype=np.uint64)
+    values = np.empty((len(table), 64), dtype=np.float32)
+    for i, (key, row) in enumerate(table.items()):
+        keys[i] = state_key_from_string(key) if isinstance(key, str) else key
+        values[i] = q_row(row)
+
+    np.save(AI_Q_VALUES_PATH, values)
+    np.save(AI_Q_KEYS_PATH, keys)
+    print(f"Wrote {len(table)} states to {AI_Q_VALUES_PATH} and {AI_Q_KEYS_PATH}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
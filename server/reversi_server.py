@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
-import pickle
+import heapq
 import random
+import selectors
+import signal
 import socket
 import struct
+import sys
 import threading
 import time
 import os
-from collections import deque
-from concurrent.futures import ThreadPoolExecutor
+import traceback
+import queue
+from collections import OrderedDict, deque
+
+try:
+    import numpy as np
+except ImportError:  # the AI opponent needs numpy, everything else does not
+    np = None
 
 ###############################################################################
 # CONFIGURATION
@@ -15,13 +24,18 @@ from concurrent.futures import ThreadPoolExecutor
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 7777
 MAX_UDP_PACKET_SIZE = 65507
+RECV_SOCKET_COUNT = 1  # >1 binds extra SO_REUSEPORT sockets to the port
+SERVER_WORKERS = 1  # >1 pre-forks that many processes sharing the port
 PLAYER_IDLE_TIMEOUT = 180
 SERVER_TICK_INTERVAL = 0.25
 CPU_THINK_DELAY_MS = (250, 700)
 ENABLE_VERBOSE_LOG = True
 MAX_CHAT_HISTORY = 50
 MAX_CHAT_MESSAGE_LENGTH = 60000
+MOVE_CACHE_SIZE = 1024
 REVERSI_AI_Q_TABLE = None
+AI_Q_VALUES_PATH = "reversi_q_values.npy"
+AI_Q_KEYS_PATH = "reversi_q_keys.npy"
 
 
 ###############################################################################
@@ -43,13 +57,6 @@ def generate_player_id():
     return random.randrange(1, 2 ** 31 - 1)
 
 
-def generate_lobby_id(existing_lobbies):
-    while True:
-        x = random.randrange(1, 65535)
-        if x not in existing_lobbies:
-            return x
-
-
 ###############################################################################
 # ENUMS & CONSTANTS
 ###############################################################################
@@ -103,148 +110,267 @@ class ErrorCode:
     MESSAGE_TOO_LONG = 12
 
 
+# Pre-compiled wire formats.
+_S_H = struct.Struct("!H")
+_S_Q = struct.Struct("!Q")
+_S_WELCOME = struct.Struct("!BIB")  # type, player id, name length
+_S_CHAT_PREFIX = struct.Struct("!BHB")  # type, lobby id, name length
+_S_STATE_HDR = struct.Struct("!BHBBBBBB")
+
+STATE_HEADER_SIZE = _S_STATE_HDR.size
+
+
 ###############################################################################
 # REVERSI LOGIC
 ###############################################################################
-DIRECTIONS = [
-    (-1, -1), (-1, 0), (-1, 1),
-    (0, -1), (0, 1),
-    (1, -1), (1, 0), (1, 1)
-]
-
-_initial_board = None
+# Bitboards: one 64-bit int per color, bit (y * 8 + x) set when that color
+# occupies (x, y). A board is the mutable pair [black, white] so that
+# board[player] is always the side to move's pieces.
+FULL_MASK = 0xFFFFFFFFFFFFFFFF
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE  # everything except x == 0
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F  # everything except x == 7
+
+# (shift, wrap mask) per direction; positive shifts move towards higher squares.
+DIRECTIONS = (
+    (1, NOT_A_FILE), (-1, NOT_H_FILE),
+    (8, FULL_MASK), (-8, FULL_MASK),
+    (9, NOT_A_FILE), (7, NOT_H_FILE),
+    (-7, NOT_A_FILE), (-9, NOT_H_FILE),
+)
+
+
+def _run_mask(wrap_mask):
+    # Horizontal and diagonal runs are only followed through squares off the
+    # a/h files: a flanked piece is never on an edge file in those directions,
+    # and no shifted run can wrap onto the next row, so the per-direction wrap
+    # mask is not needed after the last shift.
+    return wrap_mask if wrap_mask == FULL_MASK else NOT_A_FILE & NOT_H_FILE
+
+
+# The same directions split by shift sign so the kernels below never branch
+# on the direction inside their loops.
+_LEFT_DIRECTIONS = tuple((s, _run_mask(m)) for s, m in DIRECTIONS if s > 0)
+_RIGHT_DIRECTIONS = tuple((-s, _run_mask(m)) for s, m in DIRECTIONS if s < 0)
+
+
+def _build_rays():
+    # RAYS[sq] holds, per direction, the square bits walking outward from sq.
+    # Rays shorter than two squares can never flip anything and are dropped.
+    rays = []
+    for sq in range(64):
+        sx, sy = sq & 7, sq >> 3
+        square_rays = []
+        for dx, dy in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+            ray = []
+            x, y = sx + dx, sy + dy
+            while 0 <= x < 8 and 0 <= y < 8:
+                ray.append(1 << (y * 8 + x))
+                x += dx
+                y += dy
+            if len(ray) >= 2:
+                square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+RAYS = _build_rays()
+
+CORNERS = frozenset({(0, 0), (0, 7), (7, 0), (7, 7)})
+
+_INITIAL_BLACK = (1 << 27) | (1 << 36)  # (3, 3), (4, 4)
+_INITIAL_WHITE = (1 << 28) | (1 << 35)  # (4, 3), (3, 4)
 
 
 def create_initial_board():
-    global _initial_board
-    if _initial_board is None:
-        _initial_board = [[255] * 8 for _ in range(8)]
-        _initial_board[3][3] = _initial_board[4][4] = 0
-        _initial_board[3][4] = _initial_board[4][3] = 1
-    return [row[:] for row in _initial_board]
-
-
-def is_in_bounds(x, y):
-    return 0 <= x < 8 and 0 <= y < 8
+    return [_INITIAL_BLACK, _INITIAL_WHITE]
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+def iter_bits(bits):
+    while bits:
+        lsb = bits & -bits
+        yield lsb.bit_length() - 1
+        bits ^= lsb
+
+
+def legal_moves_mask(own, opp):
+    moves = 0
+    for shift, mask in _LEFT_DIRECTIONS:
+        step = mask & opp
+        t = (own << shift) & step
+        t |= (t << shift) & step
+        t |= (t << shift) & step
+        t |= (t << shift) & step
+        t |= (t << shift) & step
+        t |= (t << shift) & step
+        moves |= t << shift
+    for shift, mask in _RIGHT_DIRECTIONS:
+        step = mask & opp
+        t = (own >> shift) & step
+        t |= (t >> shift) & step
+        t |= (t >> shift) & step
+        t |= (t >> shift) & step
+        t |= (t >> shift) & step
+        t |= (t >> shift) & step
+        moves |= t >> shift
+    return moves & ~(own | opp) & FULL_MASK
+
+
+def flip_mask(own, opp, sq):
+    flips = 0
+    for ray in RAYS[sq]:
+        line = 0
+        for bit in ray:
+            if bit & opp:
+                line |= bit
+                continue
+            if bit & own:
+                flips |= line
+            break
+    return flips
 
 
 def find_legal_moves(board, player):
-    opponent = 1 - player
-    moves = set()
-    for y in range(8):
-        for x in range(8):
-            if board[y][x] != 255:
-                continue
-            for dx, dy in DIRECTIONS:
-                cx, cy = x + dx, y + dy
-                saw_opponent = False
-                while is_in_bounds(cx, cy) and board[cy][cx] == opponent:
-                    saw_opponent = True
-                    cx += dx
-                    cy += dy
-                if saw_opponent and is_in_bounds(cx, cy) and board[cy][cx] == player:
-                    moves.add((x, y))
-                    break
-    return sorted(moves)
+    moves = legal_moves_mask(board[player], board[1 - player])
+    # Bits come out in (y, x) order; callers such as cpu_select_move break
+    # ties on list order, so keep the (x, y) order of the original scan.
+    return sorted((i & 7, i >> 3) for i in iter_bits(moves))
 
 
 def apply_player_move(board, player, x, y):
-    if not is_in_bounds(x, y) or board[y][x] != 255:
+    if not (0 <= x < 8 and 0 <= y < 8):
+        return False, 0
+    move = 1 << (y * 8 + x)
+    own, opp = board[player], board[1 - player]
+    if (own | opp) & move:
         return False, 0
-    opponent = 1 - player
-    flips = []
-    for dx, dy in DIRECTIONS:
-        path = []
-        cx, cy = x + dx, y + dy
-        while is_in_bounds(cx, cy) and board[cy][cx] == opponent:
-            path.append((cx, cy))
-            cx += dx
-            cy += dy
-        if path and is_in_bounds(cx, cy) and board[cy][cx] == player:
-            flips.extend(path)
+    flips = flip_mask(own, opp, y * 8 + x)
     if not flips:
         return False, 0
-    board[y][x] = player
-    for fx, fy in flips:
-        board[fy][fx] = player
-    return True, 1 + len(flips)
+    board[player] = own | move | flips
+    board[1 - player] = opp & ~flips
+    return True, 1 + popcount(flips)
 
 
 def count_pieces(board):
-    b = w = 0
-    for row in board:
-        for c in row:
-            if c == 0:
-                b += 1
-            elif c == 1:
-                w += 1
-    return b, w
+    return popcount(board[0]), popcount(board[1])
 
 
-def clone_board(board):
-    return [row[:] for row in board]
+def count_flips(board, player, x, y):
+    """Number of pieces a move at (x, y) would flip, without applying it."""
+    sq = y * 8 + x
+    own, opp = board[player], board[1 - player]
+    if (own | opp) >> sq & 1:
+        return 0
+    return popcount(flip_mask(own, opp, sq))
+
+
+def _spread_row(row, value):
+    # Byte x of the result is `value` when bit x of the 8-bit row is set.
+    spread = 0
+    for x in range(8):
+        if row >> x & 1:
+            spread |= value << (x * 8)
+    return spread
+
+
+_ROW_EMPTY = tuple(_spread_row(r, 0xFF) for r in range(256))
+_ROW_WHITE = tuple(_spread_row(r, 0x01) for r in range(256))
+
+
+def board_to_bytes(board):
+    """Expand the bitboards into the 64-byte row-major wire format."""
+    black, white = board
+    empty = ~(black | white) & FULL_MASK
+    cells = 0
+    for shift in range(0, 64, 8):
+        row = _ROW_EMPTY[empty >> shift & 0xFF] | _ROW_WHITE[white >> shift & 0xFF]
+        cells |= row << (shift * 8)
+    return cells.to_bytes(64, "little")
 
 
 def ai_state_key(board):
-    key = ""
-    for row in board:
-        for column in row:
-            if column == 0:
-                key += "B"
-            elif column == 1:
-                key += "W"
-            else:
-                key += " "
-    return "W" + key
+    return board[0], board[1]
+
+
+class QTable:
+    """Q values memory-mapped from a float32 (n, 64) array.
+
+    Row i holds the values of the state whose (black, white) bitboards are
+    row i of the matching uint64 (n, 2) key array; see convert_q_table.py.
+    """
+
+    __slots__ = ("values", "rows")
+
+    def __init__(self, values, keys):
+        self.values = values
+        self.rows = {(black, white): i for i, (black, white) in enumerate(keys.tolist())}
+
+    def __len__(self):
+        return len(self.rows)
 
+    def get(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return self.values[row]
 
-def ai_select_move(board, ai_player):
+
+def load_ai_q_table(values_path, keys_path):
+    return QTable(np.load(values_path, mmap_mode="r"), np.load(keys_path))
+
+
+def ai_select_move(board, ai_player, moves=None):
     if not REVERSI_AI_Q_TABLE:
         print("AI not available, fallback to CPU")
-        return cpu_select_move(board, ai_player)
+        return cpu_select_move(board, ai_player, moves)
 
-    moves = find_legal_moves(board, ai_player)
+    if moves is None:
+        moves = find_legal_moves(board, ai_player)
     if not moves:
         return None
 
     s = ai_state_key(board)
-    if s not in REVERSI_AI_Q_TABLE:
+    q_values = REVERSI_AI_Q_TABLE.get(s)
+    if q_values is None:
         return random.choice(moves)
 
-    best_value = None
-    best_moves = []
+    idxs = np.fromiter((y * 8 + x for x, y in moves), dtype=np.intp, count=len(moves))
+    move_values = q_values[idxs]
+    best = np.flatnonzero(move_values == move_values.max())
+    choice = int(idxs[random.choice(best)])
+    return choice & 7, choice >> 3
 
-    for (x, y) in moves:
-        idx = x * 8 * y
-        v = REVERSI_AI_Q_TABLE[idx]
-        if best_value is None or v > best_value:
-            best_value = v
-            best_moves = [(x, y)]
-        elif v == best_value:
-            best_moves.append((x, y))
 
-    return random.choice(best_moves)
-
-
-def cpu_select_move(board, cpu_player):
-    moves = find_legal_moves(board, cpu_player)
+def cpu_select_move(board, cpu_player, moves=None):
+    if moves is None:
+        moves = find_legal_moves(board, cpu_player)
     if not moves:
         return None
-    corner_bonus = 100
+    # The corner bonus outweighs any flip count, so when corners are
+    # available only they need scoring. max() keeps the first of equally
+    # scored corners in (x, y) order, like the strict > scan below.
+    corners = [move for move in moves if move in CORNERS]
+    if corners:
+        return max(corners, key=lambda move: count_flips(board, cpu_player, *move))
+
     edge_bonus = 10
 
     best_score = -1
     best_move = moves[0]
 
     for (x, y) in moves:
-        tmp = clone_board(board)
-        success, flipped = apply_player_move(tmp, cpu_player, x, y)
-        if not success:
+        flipped = count_flips(board, cpu_player, x, y)
+        if not flipped:
             continue
-        score = flipped
-        if (x, y) in {(0, 0), (0, 7), (7, 0), (7, 7)}:
-            score += corner_bonus
-        elif x in (0, 7) or y in (0, 7):
+        score = 1 + flipped
+        if x in (0, 7) or y in (0, 7):
             score += edge_bonus
         if score > best_score:
             best_score = score
@@ -252,23 +378,6 @@ def cpu_select_move(board, cpu_player):
     return best_move
 
 
-def check_game_over(board, current_turn):
-    """Check if the game is over (no legal moves for both players)."""
-    # Check if current player has moves
-    current_moves = find_legal_moves(board, current_turn)
-    if current_moves:
-        return False
-
-    # Check if opponent has moves
-    opponent = 1 - current_turn
-    opponent_moves = find_legal_moves(board, opponent)
-    if opponent_moves:
-        return False
-
-    # Neither player has moves - game over
-    return True
-
-
 ###############################################################################
 # DATA CLASSES
 ###############################################################################
@@ -287,12 +396,28 @@ class Player:
 
 
 class ChatMessage:
-    __slots__ = ("sender", "message", "timestamp")
+    __slots__ = ("lobby_id", "sender", "message", "timestamp", "_payload")
 
-    def __init__(self, sender, message):
+    def __init__(self, lobby_id, sender, message):
+        self.lobby_id = lobby_id
         self.sender = sender
         self.message = message
         self.timestamp = current_time()
+        self._payload = None
+
+    def to_packet(self):
+        # Built once so any resend reuses the same buffer.
+        if self._payload is None:
+            name_bytes = self.sender.encode("utf-8")[:50]
+            msg_bytes = self.message.encode("utf-8")[:MAX_CHAT_MESSAGE_LENGTH]
+            self._payload = (
+                    _S_CHAT_PREFIX.pack(MessageType.CHAT_MESSAGE, self.lobby_id, len(name_bytes))
+                    + name_bytes
+                    + _S_H.pack(len(msg_bytes))
+                    + msg_bytes
+                    + _S_Q.pack(int(self.timestamp * 1000))
+            )
+        return self._payload
 
 
 class Lobby:
@@ -302,7 +427,10 @@ class Lobby:
         "started",
         "players",
         "player_addresses",
+        "player_index",
         "board",
+        "black_count",
+        "white_count",
         "turn_index",
         "status",
         "winner",
@@ -310,6 +438,8 @@ class Lobby:
         "chat_history",
         "_cpu_action_due",
         "_last_hash",
+        "_moves_cache",
+        "_state_packet",
     )
 
     def __init__(self, lobby_id, mode):
@@ -318,52 +448,139 @@ class Lobby:
         self.started = False
         self.players = []
         self.player_addresses = []
+        self.player_index = {}
         self.board = create_initial_board()
+        self.black_count, self.white_count = count_pieces(self.board)
         self.turn_index = 0
         self.status = GameStatus.WAITING
         self.winner = None
         self.pass_streak = 0
         self.chat_history = deque(maxlen=MAX_CHAT_HISTORY)
         self._last_hash = None
+        self._moves_cache = OrderedDict()
+        # Reused GAME_STATE buffer: header followed by the 64 board cells.
+        self._state_packet = bytearray(STATE_HEADER_SIZE + 64)
+
+    def add_player(self, player_id, address):
+        self.player_index[player_id] = len(self.players)
+        self.players.append(player_id)
+        self.player_addresses.append(address)
+
+    def remove_player(self, player_id):
+        idx = self.player_index.pop(player_id, None)
+        if idx is None:
+            return
+        self.players.pop(idx)
+        self.player_addresses.pop(idx)
+        self.player_index = {pid: i for i, pid in enumerate(self.players)}
 
     def add_chat(self, sender, msg):
         if len(msg.encode("utf-8")) > MAX_CHAT_MESSAGE_LENGTH:
+            return None
+        chat = ChatMessage(self.lobby_id, sender, msg)
+        self.chat_history.append(chat)
+        return chat
+
+    def legal_moves(self, player):
+        # Legality depends only on (black, white, player), so the bitboards
+        # themselves are an exact key.
+        key = (self.board[0], self.board[1], player)
+        moves = self._moves_cache.get(key)
+        if moves is None:
+            moves = find_legal_moves(self.board, player)
+            self._moves_cache[key] = moves
+            if len(self._moves_cache) > MOVE_CACHE_SIZE:
+                self._moves_cache.popitem(last=False)
+        else:
+            self._moves_cache.move_to_end(key)
+        return moves
+
+    def apply_move(self, player, x, y):
+        ok, placed = apply_player_move(self.board, player, x, y)
+        if ok:
+            # placed counts the new piece plus every flipped one.
+            if player == 0:
+                self.black_count += placed
+                self.white_count -= placed - 1
+            else:
+                self.white_count += placed
+                self.black_count -= placed - 1
+        return ok, placed
+
+    def check_game_over(self, current_turn):
+        """Check if the game is over (no legal moves for both players)."""
+        if self.legal_moves(current_turn):
             return False
-        self.chat_history.append(ChatMessage(sender, msg))
-        return True
+        return not self.legal_moves(1 - current_turn)
 
     def state_hash(self):
         return (
             self.status,
             self.turn_index,
-            tuple(tuple(r) for r in self.board),
+            self.board[0],
+            self.board[1],
         )
 
 
 ###############################################################################
 # SERVER IMPLEMENTATION
 ###############################################################################
+_TICK = object()
+
+
 class ReversiUDPServer:
-    def __init__(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.bind((SERVER_HOST, SERVER_PORT))
-        self.socket.setblocking(False)
+    def __init__(self, worker_index=0, worker_count=1):
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+
+        # With SO_REUSEPORT the kernel spreads datagrams over several sockets
+        # bound to the same port, each drained by its own receive thread.
+        # Flows hash to a fixed socket, so a client always talks to the same
+        # worker process and therefore to the worker owning its lobby.
+        # SO_REUSEPORT is only set when more than one socket is configured, so
+        # a default server still fails to bind a port already in use.
+        count = RECV_SOCKET_COUNT if hasattr(socket, "SO_REUSEPORT") else 1
+        reuse_port = count > 1 or worker_count > 1
+        self.sockets = [self._create_socket(reuse_port) for _ in range(count)]
+        self.socket = self.sockets[0]
 
         self.players_by_address = {}
         self.players_by_id = {}
         self.lobbies = {}
-
-        self.PLAYER_LOCK = threading.RLock()
-        self.LOBBY_LOCK = threading.RLock()
-
-        self.executor = ThreadPoolExecutor(max_workers=16)
+        # Lobby ids are taken from this worker's shard (id % worker_count ==
+        # worker_index) so workers never hand out the same id. Ids of closed
+        # lobbies are reused smallest first before the counter advances.
+        self._first_lobby_id = worker_index or worker_count
+        self._next_lobby_id = self._first_lobby_id
+        self._free_lobby_ids = []
+        # (idle expiry, player_id); entries are re-checked and re-pushed lazily
+        # when they surface, so refresh() never has to touch the heap.
+        self._idle_heap = []
+
+        # Receive threads only enqueue datagrams; all player and lobby state
+        # is owned by the single game loop thread, so no locks are needed.
+        self.inbox = queue.SimpleQueue()
 
         self.running = True
 
+    @staticmethod
+    def _create_socket(reuse_port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((SERVER_HOST, SERVER_PORT))
+        sock.setblocking(False)
+        return sock
+
     def start(self):
-        print(f"Server started udp://{SERVER_HOST}:{SERVER_PORT}")
-        threading.Thread(target=self._recv_loop, daemon=True).start()
+        print(
+            f"Server started udp://{SERVER_HOST}:{SERVER_PORT}"
+            f" (worker {self.worker_index + 1}/{self.worker_count}, pid {os.getpid()})"
+        )
+        for sock in self.sockets:
+            threading.Thread(target=self._recv_loop, args=(sock,), daemon=True).start()
         threading.Thread(target=self._tick_loop, daemon=True).start()
+        threading.Thread(target=self._game_loop, name="GameLoop", daemon=True).start()
 
         try:
             while self.running:
@@ -375,35 +592,60 @@ class ReversiUDPServer:
     ###############################################################################
     # RECEIVE LOOP
     ###############################################################################
-    def _recv_loop(self):
+    def _recv_loop(self, sock):
+        sel = selectors.DefaultSelector()
+        sel.register(sock, selectors.EVENT_READ)
+        while self.running:
+            if not sel.select(timeout=0.1):
+                continue
+            # Drain everything queued on the socket before waiting again.
+            while True:
+                try:
+                    data, addr = sock.recvfrom(MAX_UDP_PACKET_SIZE)
+                except BlockingIOError:
+                    break
+                except Exception as e:
+                    log_message("recv error:", e)
+                    break
+                self.inbox.put((data, addr))
+        sel.close()
+
+    ###############################################################################
+    # GAME LOOP
+    ###############################################################################
+    def _game_loop(self):
         while self.running:
+            data, addr = self.inbox.get()
             try:
-                data, addr = self.socket.recvfrom(MAX_UDP_PACKET_SIZE)
-                self.executor.submit(self._handle_packet, data, addr)
-            except BlockingIOError:
-                time.sleep(0.001)
+                if data is _TICK:
+                    self._tick()
+                else:
+                    self._handle_packet(data, addr)
             except Exception as e:
-                log_message("recv error:", e)
+                log_message("game loop error:", e)
 
     ###############################################################################
     # HANDLE PACKETS
     ###############################################################################
     def _get_or_create_player(self, addr):
-        with self.PLAYER_LOCK:
-            p = self.players_by_address.get(addr)
-            if p:
-                p.refresh()
-                return p
-
-            p = Player(addr)
-            self.players_by_address[addr] = p
-            self.players_by_id[p.player_id] = p
+        p = self.players_by_address.get(addr)
+        if p:
             p.refresh()
             return p
 
+        p = Player(addr)
+        self.players_by_address[addr] = p
+        self.players_by_id[p.player_id] = p
+        p.refresh()
+        heapq.heappush(self._idle_heap, (p.last_active + PLAYER_IDLE_TIMEOUT, p.player_id))
+        return p
+
     def _handle_packet(self, data, addr):
         if not data:
             return
+        # Sub-handlers slice the view, so name/message bytes are only copied
+        # once, when they are decoded.
+        data = memoryview(data)
         msg = data[0]
         player = self._get_or_create_player(addr)
 
@@ -431,16 +673,12 @@ class ReversiUDPServer:
         name_len = data[1]
         name = "Player"
         if name_len:
-            name = data[2: 2 + name_len].decode("utf-8", "ignore")
+            name = str(data[2: 2 + name_len], "utf-8", "ignore")
         player.name = name
 
         # WELCOME PACKET
-        payload = (
-                bytes([MessageType.WELCOME])
-                + struct.pack("!I", player.player_id)
-                + bytes([len(name.encode("utf-8"))])
-                + name.encode("utf-8")
-        )
+        name_bytes = name.encode("utf-8")
+        payload = _S_WELCOME.pack(MessageType.WELCOME, player.player_id, len(name_bytes)) + name_bytes
 
         self.socket.sendto(payload, player.address)
 
@@ -449,32 +687,41 @@ class ReversiUDPServer:
     ###############################################################################
     def _handle_create_lobby(self, data, player):
         mode = data[1]
-        with self.LOBBY_LOCK:
-            lobby_id = generate_lobby_id(self.lobbies)
-            lb = Lobby(lobby_id, mode)
-            lb.players.append(player.player_id)
-            lb.player_addresses.append(player.address)
-            self.lobbies[lobby_id] = lb
-            player.lobby_id = lobby_id
-
-            self._maybe_start(lobby_id)
+        lobby_id = self._generate_lobby_id()
+        lb = Lobby(lobby_id, mode)
+        lb.add_player(player.player_id, player.address)
+        self.lobbies[lobby_id] = lb
+        player.lobby_id = lobby_id
+
+        self._maybe_start(lobby_id)
+
+    def _generate_lobby_id(self):
+        if self._free_lobby_ids:
+            return heapq.heappop(self._free_lobby_ids)
+
+        for _ in range(65535 // self.worker_count):
+            lobby_id = self._next_lobby_id
+            self._next_lobby_id += self.worker_count
+            if self._next_lobby_id >= 65535:
+                self._next_lobby_id = self._first_lobby_id
+            if lobby_id not in self.lobbies:
+                return lobby_id
+        raise RuntimeError("no free lobby ids")
 
     def _maybe_start(self, lobby_id):
-        with self.LOBBY_LOCK:
-            lb = self.lobbies.get(lobby_id)
-            if not lb or lb.started:
-                return
-
-            if lb.mode in (GameMode.PLAYER_VS_CPU, GameMode.PLAYER_VS_AI) and len(lb.players) == 1:
-                lb.players.append("AI" if lb.mode == GameMode.PLAYER_VS_AI else "CPU")
-                lb.player_addresses.append(None)
-
-            if len(lb.players) == 2:
-                lb.started = True
-                lb.status = GameStatus.PLAYING
-                lb.turn_index = random.randint(0, 1)
-                log_message(f"Lobby {lobby_id} started, first turn: player {lb.turn_index}")
-                self._send_state(lb)
+        lb = self.lobbies.get(lobby_id)
+        if not lb or lb.started:
+            return
+
+        if lb.mode in (GameMode.PLAYER_VS_CPU, GameMode.PLAYER_VS_AI) and len(lb.players) == 1:
+            lb.add_player("AI" if lb.mode == GameMode.PLAYER_VS_AI else "CPU", None)
+
+        if len(lb.players) == 2:
+            lb.started = True
+            lb.status = GameStatus.PLAYING
+            lb.turn_index = random.randint(0, 1)
+            log_message(f"Lobby {lobby_id} started, first turn: player {lb.turn_index}")
+            self._send_state(lb)
 
     ###############################################################################
     # CHAT
@@ -483,102 +730,85 @@ class ReversiUDPServer:
         if not player.lobby_id:
             return self._send_error(player.address, ErrorCode.NOT_IN_LOBBY)
 
-        with self.LOBBY_LOCK:
-            lb = self.lobbies.get(player.lobby_id)
-            if not lb:
-                return self._send_error(player.address, ErrorCode.LOBBY_NOT_FOUND)
-
-            if len(data) < 3:
-                return self._send_error(player.address, ErrorCode.BAD_REQUEST)
+        lb = self.lobbies.get(player.lobby_id)
+        if not lb:
+            return self._send_error(player.address, ErrorCode.LOBBY_NOT_FOUND)
 
-            msg_len = struct.unpack_from("!H", data, 1)[0]
-            start = 3
-            end = start + msg_len
+        if len(data) < 3:
+            return self._send_error(player.address, ErrorCode.BAD_REQUEST)
 
-            if msg_len > MAX_CHAT_MESSAGE_LENGTH or len(data) < end:
-                return self._send_error(player.address, ErrorCode.MESSAGE_TOO_LONG)
+        msg_len = _S_H.unpack_from(data, 1)[0]
+        start = 3
+        end = start + msg_len
 
-            message = data[start:end].decode("utf-8", "ignore")
+        if msg_len > MAX_CHAT_MESSAGE_LENGTH or len(data) < end:
+            return self._send_error(player.address, ErrorCode.MESSAGE_TOO_LONG)
 
-            if not lb.add_chat(player.name, message):
-                return self._send_error(player.address, ErrorCode.MESSAGE_TOO_LONG)
+        message = str(data[start:end], "utf-8", "ignore")
 
-            self._broadcast_chat(lb, player.name, message)
+        chat = lb.add_chat(player.name, message)
+        if not chat:
+            return self._send_error(player.address, ErrorCode.MESSAGE_TOO_LONG)
 
-    def _broadcast_chat(self, lb, sender, message):
-        name_bytes = sender.encode("utf-8")[:50]
-        msg_bytes = message.encode("utf-8")[:MAX_CHAT_MESSAGE_LENGTH]
+        self._broadcast_chat(lb, chat)
 
-        payload = (
-                bytes([MessageType.CHAT_MESSAGE])
-                + struct.pack("!H", lb.lobby_id)
-                + bytes([len(name_bytes)])
-                + name_bytes
-                + struct.pack("!H", len(msg_bytes))
-                + msg_bytes
-                + struct.pack("!Q", int(current_time() * 1000))
-        )
-
-        for addr in lb.player_addresses:
-            if addr:
-                self.socket.sendto(payload, addr)
+    def _broadcast_chat(self, lb, chat):
+        self._broadcast(lb, chat.to_packet())
 
     ###############################################################################
     # PLACE
     ###############################################################################
     def _handle_place(self, data, player):
-        with self.LOBBY_LOCK:
-            lb = self.lobbies.get(player.lobby_id)
-            if not lb:
-                return self._send_error(player.address, ErrorCode.NOT_IN_LOBBY)
+        lb = self.lobbies.get(player.lobby_id)
+        if not lb:
+            return self._send_error(player.address, ErrorCode.NOT_IN_LOBBY)
 
-            if lb.status != GameStatus.PLAYING:
-                return self._send_error(player.address, ErrorCode.GAME_NOT_ACTIVE)
+        if lb.status != GameStatus.PLAYING:
+            return self._send_error(player.address, ErrorCode.GAME_NOT_ACTIVE)
 
-            try:
-                idx = lb.players.index(player.player_id)
-            except ValueError:
-                return self._send_error(
-                    player.address, ErrorCode.SPECTATOR_MOVE_NOT_ALLOWED
-                )
-
-            if lb.turn_index != idx:
-                return self._send_error(player.address, ErrorCode.NOT_YOUR_TURN)
-
-            x, y = data[1], data[2]
-            if (x, y) not in find_legal_moves(lb.board, idx):
-                return self._send_error(player.address, ErrorCode.ILLEGAL_MOVE)
-
-            ok, _ = apply_player_move(lb.board, idx, x, y)
-            if not ok:
-                return self._send_error(player.address, ErrorCode.APPLY_FAILED)
-
-            log_message(f"Player {idx} ({player.name}) placed at ({x}, {y})")
-
-            # Switch turn
-            lb.turn_index = 1 - lb.turn_index
-
-            # Check if next player has moves
-            next_moves = find_legal_moves(lb.board, lb.turn_index)
-            if not next_moves:
-                log_message(f"Player {lb.turn_index} has no moves, checking game over")
-                # Check if game is over
-                if check_game_over(lb.board, lb.turn_index):
-                    lb.status = GameStatus.FINISHED
-                    p0, p1 = count_pieces(lb.board)
-                    if p0 > p1:
-                        lb.winner = 0
-                    elif p1 > p0:
-                        lb.winner = 1
-                    else:
-                        lb.winner = -1  # Tie
-                    log_message(f"Game over! Winner: {lb.winner}, Score: {p0}-{p1}")
+        idx = lb.player_index.get(player.player_id)
+        if idx is None:
+            return self._send_error(
+                player.address, ErrorCode.SPECTATOR_MOVE_NOT_ALLOWED
+            )
+
+        if lb.turn_index != idx:
+            return self._send_error(player.address, ErrorCode.NOT_YOUR_TURN)
+
+        x, y = data[1], data[2]
+        if (x, y) not in lb.legal_moves(idx):
+            return self._send_error(player.address, ErrorCode.ILLEGAL_MOVE)
+
+        ok, _ = lb.apply_move(idx, x, y)
+        if not ok:
+            return self._send_error(player.address, ErrorCode.APPLY_FAILED)
+
+        log_message(f"Player {idx} ({player.name}) placed at ({x}, {y})")
+
+        # Switch turn
+        lb.turn_index = 1 - lb.turn_index
+
+        # Check if next player has moves
+        next_moves = lb.legal_moves(lb.turn_index)
+        if not next_moves:
+            log_message(f"Player {lb.turn_index} has no moves, checking game over")
+            # Check if game is over
+            if lb.check_game_over(lb.turn_index):
+                lb.status = GameStatus.FINISHED
+                p0, p1 = lb.black_count, lb.white_count
+                if p0 > p1:
+                    lb.winner = 0
+                elif p1 > p0:
+                    lb.winner = 1
                 else:
-                    # Skip to other player
-                    log_message(f"Player {lb.turn_index} has no moves, skipping turn")
-                    lb.turn_index = 1 - lb.turn_index
+                    lb.winner = -1  # Tie
+                log_message(f"Game over! Winner: {lb.winner}, Score: {p0}-{p1}")
+            else:
+                # Skip to other player
+                log_message(f"Player {lb.turn_index} has no moves, skipping turn")
+                lb.turn_index = 1 - lb.turn_index
 
-            self._send_state(lb)
+        self._send_state(lb)
 
     ###############################################################################
     # GAME STATE
@@ -589,30 +819,26 @@ class ReversiUDPServer:
             return
         lb._last_hash = h
 
-        b, w = count_pieces(lb.board)
-
-        header = bytearray()
-        header.append(MessageType.GAME_STATE)
-        header.extend(
-            struct.pack(
-                "!HBBBBBB",
-                lb.lobby_id,
-                lb.status,
-                lb.turn_index,
-                255,
-                b,
-                w,
-                0,
-            )
+        b, w = lb.black_count, lb.white_count
+
+        payload = lb._state_packet
+        _S_STATE_HDR.pack_into(
+            payload,
+            0,
+            MessageType.GAME_STATE,
+            lb.lobby_id,
+            lb.status,
+            lb.turn_index,
+            255,
+            b,
+            w,
+            0,
         )
+        payload[STATE_HEADER_SIZE:] = board_to_bytes(lb.board)
 
-        flat = bytearray()
-        for row in lb.board:
-            for c in row:
-                flat.append(c)
-
-        payload = bytes(header + flat)
+        self._broadcast(lb, payload)
 
+    def _broadcast(self, lb, payload):
         for addr in lb.player_addresses:
             if addr:
                 self.socket.sendto(payload, addr)
@@ -621,22 +847,19 @@ class ReversiUDPServer:
     # LEAVE
     ###############################################################################
     def _handle_leave(self, player):
-        with self.LOBBY_LOCK:
-            if not player.lobby_id:
-                return
-            lb = self.lobbies.get(player.lobby_id)
-            if not lb:
-                player.lobby_id = None
-                return
-
-            if player.player_id in lb.players:
-                idx = lb.players.index(player.player_id)
-                lb.players.pop(idx)
-                lb.player_addresses.pop(idx)
-
+        if not player.lobby_id:
+            return
+        lb = self.lobbies.get(player.lobby_id)
+        if not lb:
             player.lobby_id = None
-            if not lb.players:
-                del self.lobbies[lb.lobby_id]
+            return
+
+        lb.remove_player(player.player_id)
+
+        player.lobby_id = None
+        if not lb.players:
+            del self.lobbies[lb.lobby_id]
+            heapq.heappush(self._free_lobby_ids, lb.lobby_id)
 
     ###############################################################################
     # TICK LOOP
@@ -644,74 +867,75 @@ class ReversiUDPServer:
     def _tick_loop(self):
         while self.running:
             time.sleep(SERVER_TICK_INTERVAL)
-            self._tick()
+            self.inbox.put((_TICK, None))
 
     def _tick(self):
         ts = current_time()
 
         # CPU MOVE
-        with self.LOBBY_LOCK:
-            for lb in list(self.lobbies.values()):
-                if (
-                        lb.started
-                        and lb.status == GameStatus.PLAYING
-                        and lb.turn_index < len(lb.players)
-                        and lb.players[lb.turn_index] in ("CPU", "AI")
-                ):
-                    if not hasattr(lb, "_cpu_action_due"):
-                        d = random.randint(*CPU_THINK_DELAY_MS) / 1000
-                        lb._cpu_action_due = ts + d
-                    elif ts >= lb._cpu_action_due:
-                        cpu_name = lb.players[lb.turn_index]
-                        if cpu_name == "AI":
-                            mv = ai_select_move(lb.board, lb.turn_index)
-                        else:
-                            mv = cpu_select_move(lb.board, lb.turn_index)
+        for lb in list(self.lobbies.values()):
+            if (
+                    lb.started
+                    and lb.status == GameStatus.PLAYING
+                    and lb.turn_index < len(lb.players)
+                    and lb.players[lb.turn_index] in ("CPU", "AI")
+            ):
+                if not hasattr(lb, "_cpu_action_due"):
+                    d = random.randint(*CPU_THINK_DELAY_MS) / 1000
+                    lb._cpu_action_due = ts + d
+                elif ts >= lb._cpu_action_due:
+                    cpu_name = lb.players[lb.turn_index]
+                    if cpu_name == "AI":
+                        mv = ai_select_move(lb.board, lb.turn_index, lb.legal_moves(lb.turn_index))
+                    else:
+                        mv = cpu_select_move(lb.board, lb.turn_index, lb.legal_moves(lb.turn_index))
 
-                        if mv:
-                            x, y = mv
-                            apply_player_move(lb.board, lb.turn_index, x, y)
-                            log_message(f"{cpu_name} (player {lb.turn_index}) moved to ({x}, {y})")
-                        else:
-                            log_message(f"{cpu_name} has no moves")
-
-                        # Switch turn
-                        lb.turn_index = 1 - lb.turn_index
-
-                        # Check if next player has moves
-                        next_moves = find_legal_moves(lb.board, lb.turn_index)
-                        if not next_moves:
-                            if check_game_over(lb.board, lb.turn_index):
-                                lb.status = GameStatus.FINISHED
-                                p0, p1 = count_pieces(lb.board)
-                                if p0 > p1:
-                                    lb.winner = 0
-                                elif p1 > p0:
-                                    lb.winner = 1
-                                else:
-                                    lb.winner = -1
-                                log_message(f"Game over! Winner: {lb.winner}, Score: {p0}-{p1}")
+                    if mv:
+                        x, y = mv
+                        lb.apply_move(lb.turn_index, x, y)
+                        log_message(f"{cpu_name} (player {lb.turn_index}) moved to ({x}, {y})")
+                    else:
+                        log_message(f"{cpu_name} has no moves")
+
+                    # Switch turn
+                    lb.turn_index = 1 - lb.turn_index
+
+                    # Check if next player has moves
+                    next_moves = lb.legal_moves(lb.turn_index)
+                    if not next_moves:
+                        if lb.check_game_over(lb.turn_index):
+                            lb.status = GameStatus.FINISHED
+                            p0, p1 = lb.black_count, lb.white_count
+                            if p0 > p1:
+                                lb.winner = 0
+                            elif p1 > p0:
+                                lb.winner = 1
                             else:
-                                # Skip turn back to CPU
-                                lb.turn_index = 1 - lb.turn_index
+                                lb.winner = -1
+                            log_message(f"Game over! Winner: {lb.winner}, Score: {p0}-{p1}")
+                        else:
+                            # Skip turn back to CPU
+                            lb.turn_index = 1 - lb.turn_index
 
-                        if hasattr(lb, "_cpu_action_due"):
-                            del lb._cpu_action_due
-                        self._send_state(lb)
+                    if hasattr(lb, "_cpu_action_due"):
+                        del lb._cpu_action_due
+                    self._send_state(lb)
 
         # Idle players
         if int(ts) % 5 == 0:
-            with self.PLAYER_LOCK:
-                dead = [
-                    (addr, p)
-                    for addr, p in self.players_by_address.items()
-                    if ts - p.last_active > PLAYER_IDLE_TIMEOUT
-                ]
-                for addr, p in dead:
-                    del self.players_by_address[addr]
-                    self.players_by_id.pop(p.player_id, None)
-                    if p.lobby_id:
-                        self._handle_leave(p)
+            heap = self._idle_heap
+            while heap and heap[0][0] < ts:
+                _, player_id = heapq.heappop(heap)
+                p = self.players_by_id.get(player_id)
+                if not p:
+                    continue
+                if ts - p.last_active <= PLAYER_IDLE_TIMEOUT:
+                    heapq.heappush(heap, (p.last_active + PLAYER_IDLE_TIMEOUT, player_id))
+                    continue
+                del self.players_by_address[p.address]
+                del self.players_by_id[player_id]
+                if p.lobby_id:
+                    self._handle_leave(p)
 
     ###############################################################################
     # ERROR
@@ -723,9 +947,99 @@ class ReversiUDPServer:
 ###############################################################################
 # MAIN
 ###############################################################################
-if __name__ == "__main__":
-    if os.path.exists("reversi_q_table.pkl"):
-        with open("reversi_q_table.pkl", "rb") as f:
-            REVERSI_AI_Q_TABLE = pickle.load(f)
+_STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def _ignore_stop_signals():
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_worker(index, count):
+    # Runs in a forked child and never returns: os._exit skips the parent's
+    # cleanup, so report failures and flush buffered logs explicitly.
+    # Stop signals only clear server.running, so they can never interrupt
+    # the failure report below; they are blocked until this handler is set.
+    server = None
+    stopped = False
+
+    def _stop(signum, frame):
+        nonlocal stopped
+        stopped = True
+        if server:
+            server.running = False
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, _STOP_SIGNALS)
+
+    status = 0
+    try:
+        server = ReversiUDPServer(index, count)
+        if stopped:
+            server.running = False
+        server.start()
+        if stopped:
+            print("Stopping...")
+    except BaseException:
+        status = 1
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def run_workers(count):
+    """Run count forked server processes sharing the port via SO_REUSEPORT."""
+    if count <= 1 or not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+        ReversiUDPServer().start()
+        return
 
-    ReversiUDPServer().start()
+    def _stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Treat SIGTERM like Ctrl-C in the parent so the workers are taken down too.
+    signal.signal(signal.SIGTERM, _stop)
+
+    children = []
+    try:
+        for index in range(1, count):
+            # Keep stop signals pending across fork until the child has
+            # installed its own handlers.
+            signal.pthread_sigmask(signal.SIG_BLOCK, _STOP_SIGNALS)
+            pid = os.fork()
+            if pid == 0:
+                _run_worker(index, count)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, _STOP_SIGNALS)
+            children.append(pid)
+
+        ReversiUDPServer(0, count).start()
+    finally:
+        # A second signal must not interrupt taking the workers down.
+        _ignore_stop_signals()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                continue
+            if status:
+                print(f"Worker pid {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+
+
+if __name__ == "__main__":
+    if os.path.exists(AI_Q_VALUES_PATH) and os.path.exists(AI_Q_KEYS_PATH):
+        if np is None:
+            print("numpy is not installed, AI lobbies will use the CPU player")
+        else:
+            REVERSI_AI_Q_TABLE = load_ai_q_table(AI_Q_VALUES_PATH, AI_Q_KEYS_PATH)
+    elif os.path.exists("reversi_q_table.pkl"):
+        print("Found reversi_q_table.pkl, run convert_q_table.py to enable the AI player")
+
+    # Workers are forked after the Q-table is mapped so they share its pages.
+    run_workers(SERVER_WORKERS)